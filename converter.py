@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import asyncio
+
+
+def build_command(executable):
+    """Command prefix for the converter, a .py stand-in is run with the current interpreter"""
+    if executable.lower().endswith('.py'):
+        return [sys.executable, executable]
+    return [executable]
+
+
+class ConversionJob:
+    def __init__(self, key, source_path, output_path, payload=None):
+        self.key = key
+        self.source_path = source_path
+        self.output_path = output_path
+        self.payload = payload
+        self.attempts = 0
+        self.error = None
+
+
+class ConversionScheduler:
+    """Runs conversions with asyncio subprocesses, adapting concurrency to the observed throughput"""
+    THROUGHPUT_WINDOW = 8
+    TICK_SECONDS = 0.1
+
+    def __init__(self, command, max_workers, timeout=30, retries=2, min_workers=1):
+        self.command = list(command)
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.timeout = timeout
+        self.retries = retries
+        self.limit = max(self.min_workers, min(self.max_workers, os.cpu_count() or 4))
+        self.window_start = None
+        self.window_done = 0
+        self.last_throughput = None
+
+    def run(self, jobs, on_result=None, on_tick=None, postprocess=None):
+        return asyncio.run(self.run_async(jobs, on_result, on_tick, postprocess))
+
+    async def run_async(self, jobs, on_result=None, on_tick=None, postprocess=None):
+        """Converts all jobs and calls on_result(job, success) as each one finishes, in completion order"""
+        pending = list(jobs)
+        running = {}
+        results = {}
+        self.window_start = time.monotonic()
+        self.window_done = 0
+
+        while pending or running:
+            while pending and len(running) < self.limit:
+                job = pending.pop(0)
+                job.attempts += 1
+                task = asyncio.ensure_future(self.convert(job, postprocess))
+                running[task] = job
+
+            done, _ = await asyncio.wait(running, timeout=self.TICK_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                job = running.pop(task)
+                success, timed_out = task.result()
+                if timed_out:
+                    self.decrease_limit()
+                if not success and job.attempts <= self.retries:
+                    print(f"Retrying {job.key} ({job.attempts}/{self.retries}): {job.error}")
+                    pending.append(job)
+                    continue
+                results[job.key] = success
+                self.record_completion()
+                if on_result:
+                    on_result(job, success)
+
+            if on_tick:
+                on_tick()
+
+        return results
+
+    async def convert(self, job, postprocess):
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.command, job.source_path, job.output_path,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            if process.returncode != 0 or not os.path.exists(job.output_path):
+                job.error = f"Conversion error: {stderr.decode(errors='replace').strip()}"
+                return False, False
+            if postprocess:
+                await asyncio.get_running_loop().run_in_executor(None, postprocess, job)
+            job.error = None
+            return True, False
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                # The process exited just as the timeout fired
+                pass
+            await process.wait()
+            job.error = f"Timeout during conversion after {self.timeout} s"
+            return False, True
+        except Exception as e:
+            job.error = str(e)
+            return False, False
+
+    def record_completion(self):
+        """Adds a worker while throughput keeps rising and removes one when it drops"""
+        self.window_done += 1
+        if self.window_done < self.THROUGHPUT_WINDOW:
+            return
+        now = time.monotonic()
+        throughput = self.window_done / max(now - self.window_start, 1e-6)
+        if self.last_throughput is None or throughput > self.last_throughput * 1.05:
+            self.limit = min(self.limit + 1, self.max_workers)
+        elif throughput < self.last_throughput * 0.9:
+            self.limit = max(self.limit - 1, self.min_workers)
+        self.last_throughput = throughput
+        self.window_start = now
+        self.window_done = 0
+
+    def decrease_limit(self):
+        self.limit = max(self.limit // 2, self.min_workers)
@@ -0,0 +1,167 @@
+import os
+import ctypes
+from tile_cache import open_tile
+
+CANVAS_BYTES_PER_PIXEL = 3
+DECODED_BYTES_PER_PIXEL = 4
+PREVIEW_BYTES_PER_PIXEL = 4
+ENCODER_BASE_BYTES = 8 * 1024 * 1024
+ENCODER_BLOCK_ROWS = 64
+# Row block, its shifted copies, four filter candidates, their bytes and the scoring buffers
+ENCODER_FILTER_COPIES = 14
+STREAMING_FORMATS = ('.png',)
+FALLBACK_TOTAL_MEMORY = 8 * 1024 * 1024 * 1024
+
+
+def get_total_memory():
+    """Returns the physical memory of the machine in bytes, or None if it cannot be detected"""
+    try:
+        if os.name == 'nt':
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ('dwLength', ctypes.c_ulong),
+                    ('dwMemoryLoad', ctypes.c_ulong),
+                    ('ullTotalPhys', ctypes.c_ulonglong),
+                    ('ullAvailPhys', ctypes.c_ulonglong),
+                    ('ullTotalPageFile', ctypes.c_ulonglong),
+                    ('ullAvailPageFile', ctypes.c_ulonglong),
+                    ('ullTotalVirtual', ctypes.c_ulonglong),
+                    ('ullAvailVirtual', ctypes.c_ulonglong),
+                    ('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+                ]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return int(status.ullTotalPhys)
+            return None
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def default_memory_budget_mb():
+    """Half of the physical memory, used as the initial value of the memory budget field"""
+    total = get_total_memory() or FALLBACK_TOTAL_MEMORY
+    return max(512, total // 2 // (1024 * 1024))
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class JobPlan:
+    def __init__(self, job, strategy, workers, band_rows, band_height, canvas_size, tile_size, peak_bytes, budget_bytes):
+        self.job = job
+        self.strategy = strategy
+        self.workers = workers
+        self.band_rows = band_rows
+        self.band_height = band_height
+        self.canvas_size = canvas_size
+        self.tile_size = tile_size
+        self.peak_bytes = peak_bytes
+        self.budget_bytes = budget_bytes
+
+    @property
+    def fits(self):
+        return self.peak_bytes <= self.budget_bytes
+
+    def describe(self):
+        if self.strategy == 'banded':
+            strategy = f"banded ({self.band_rows} tile rows / {self.band_height} px per band)"
+        else:
+            strategy = "in-memory"
+        description = (
+            f"{self.job.capitalize()} plan: {strategy}, {self.workers} workers, "
+            f"canvas {self.canvas_size[0]}x{self.canvas_size[1]}, "
+            f"predicted peak {format_bytes(self.peak_bytes)} of {format_bytes(self.budget_bytes)} budget"
+        )
+        if not self.fits:
+            description += " (over budget)"
+        return description
+
+
+class MemoryPlanner:
+    """Estimates memory use of merge and preview jobs and picks a strategy that fits the budget"""
+
+    def __init__(self, budget_mb, max_workers):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.max_workers = max(1, max_workers)
+
+    def probe_tile_size(self, available_png_files):
+        """Reads the size of the first tile from its header without decoding the pixels"""
+        filename, image_directory = available_png_files[0]
+        with open_tile(os.path.join(image_directory, filename)) as img:
+            return img.size
+
+    def plan_merge(self, grid_size, source_tile_size, trim_pixels, output_path, tile_count):
+        tile_width = source_tile_size[0] - 2 * trim_pixels
+        tile_height = source_tile_size[1] - 2 * trim_pixels
+        if tile_width <= 0 or tile_height <= 0:
+            raise ValueError("Trim pixels are larger than the tile size.")
+
+        canvas_width = tile_width * grid_size
+        canvas_height = tile_height * grid_size
+        decoded_tile = source_tile_size[0] * source_tile_size[1] * DECODED_BYTES_PER_PIXEL
+        cropped_tile = tile_width * tile_height * DECODED_BYTES_PER_PIXEL
+        row_stride = canvas_width * CANVAS_BYTES_PER_PIXEL
+
+        def in_memory_peak(workers):
+            canvas = row_stride * canvas_height
+            tiles = tile_count * cropped_tile
+            in_flight = workers * (decoded_tile + cropped_tile)
+            encoder = ENCODER_BASE_BYTES + 2 * row_stride
+            return canvas + tiles + in_flight + encoder
+
+        def banded_peak(band_rows, workers):
+            band = row_stride * band_rows * tile_height
+            tiles = min(tile_count, grid_size * band_rows) * cropped_tile
+            in_flight = workers * (decoded_tile + cropped_tile)
+            encoder = ENCODER_BASE_BYTES + ENCODER_FILTER_COPIES * ENCODER_BLOCK_ROWS * (row_stride + 1)
+            return band + tiles + in_flight + encoder
+
+        def make_plan(strategy, workers, band_rows, peak):
+            return JobPlan('merge', strategy, workers, band_rows, band_rows * tile_height,
+                           (canvas_width, canvas_height), (tile_width, tile_height), peak, self.budget_bytes)
+
+        workers = self.fit_workers(in_memory_peak, min(self.max_workers, max(1, tile_count)))
+        in_memory = make_plan('in-memory', workers, grid_size, in_memory_peak(workers))
+        if in_memory.fits or os.path.splitext(output_path)[1].lower() not in STREAMING_FORMATS:
+            return in_memory
+
+        for band_rows in range(grid_size - 1, 0, -1):
+            workers = min(self.max_workers, grid_size * band_rows)
+            peak = banded_peak(band_rows, workers)
+            if peak <= self.budget_bytes:
+                return make_plan('banded', workers, band_rows, peak)
+
+        workers = self.fit_workers(lambda w: banded_peak(1, w), min(self.max_workers, grid_size))
+        return make_plan('banded', workers, 1, banded_peak(1, workers))
+
+    def plan_preview(self, grid_size, source_tile_size, trim_pixels, preview_quality, tile_count):
+        canvas_width = canvas_height = preview_quality * grid_size
+        decoded_tile = source_tile_size[0] * source_tile_size[1] * DECODED_BYTES_PER_PIXEL
+        cropped_tile = (source_tile_size[0] - 2 * trim_pixels) * (source_tile_size[1] - 2 * trim_pixels) * DECODED_BYTES_PER_PIXEL
+        scaled_tile = preview_quality * preview_quality * DECODED_BYTES_PER_PIXEL
+        # The preview store is a single 32-bit QImage that is filled and painted in place
+        canvas = canvas_width * canvas_height * PREVIEW_BYTES_PER_PIXEL
+
+        def preview_peak(workers):
+            in_flight = workers * (decoded_tile + cropped_tile + scaled_tile)
+            return canvas + tile_count * scaled_tile + in_flight
+
+        workers = self.fit_workers(preview_peak, min(self.max_workers, max(1, tile_count)))
+        return JobPlan('preview', 'in-memory', workers, grid_size, canvas_height,
+                       (canvas_width, canvas_height), (preview_quality, preview_quality),
+                       preview_peak(workers), self.budget_bytes)
+
+    def fit_workers(self, peak_for_workers, max_workers):
+        """Returns the largest worker count whose predicted peak fits in the budget (at least 1)"""
+        for workers in range(max_workers, 0, -1):
+            if peak_for_workers(workers) <= self.budget_bytes:
+                return workers
+        return 1
@@ -0,0 +1,117 @@
+import array
+import struct
+import zlib
+from PIL import Image, ImageChops
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Filtered bytes are scored as signed values, so 255 counts as -1
+SIGNED_ABS_LUT = [min(value, 256 - value) for value in range(256)] * 3
+
+
+class StreamingPNGWriter:
+    """Writes an RGB PNG band by band, so the full canvas never has to be in memory"""
+    CHUNK_SIZE = 1024 * 1024
+    ROWS_PER_BLOCK = 64
+
+    def __init__(self, path, width, height, compress_level=6):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.compress_level = compress_level
+        self.rows_written = 0
+        self.file = None
+        self.compressor = None
+        self.pending = []
+        self.pending_size = 0
+        self.previous_row = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'wb')
+        self.file.write(PNG_SIGNATURE)
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+        self.compressor = zlib.compressobj(self.compress_level)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.finish()
+        finally:
+            self.file.close()
+        return False
+
+    def write_chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def write_band(self, band):
+        if band.mode != 'RGB':
+            band = band.convert('RGB')
+        if band.width != self.width:
+            raise ValueError(f"Band width {band.width} does not match image width {self.width}.")
+        if self.rows_written + band.height > self.height:
+            raise ValueError("Bands exceed the image height.")
+
+        stride = self.width * 3
+        for top in range(0, band.height, self.ROWS_PER_BLOCK):
+            bottom = min(top + self.ROWS_PER_BLOCK, band.height)
+            block = band.crop((0, top, self.width, bottom))
+            candidates = self.filter_candidates(block)
+            choices = self.choose_filters(candidates)
+            data = [candidate.tobytes() for candidate in candidates]
+            rows = b''.join(bytes((choice,)) + data[choice][i * stride:(i + 1) * stride]
+                            for i, choice in enumerate(choices))
+            self.add_compressed(self.compressor.compress(rows))
+            self.previous_row = block.crop((0, block.height - 1, self.width, block.height))
+        self.rows_written += band.height
+
+    def filter_candidates(self, block):
+        """Applies the None, Sub, Up and Average PNG filters to every row of the block"""
+        up = Image.new('RGB', block.size)
+        if self.previous_row is not None:
+            up.paste(self.previous_row, (0, 0))
+        up.paste(block.crop((0, 0, self.width, block.height - 1)), (0, 1))
+        left = Image.new('RGB', block.size)
+        left.paste(block, (1, 0))
+        average = ImageChops.add(left, up, scale=2.0)
+        return [
+            block,
+            ImageChops.subtract_modulo(block, left),
+            ImageChops.subtract_modulo(block, up),
+            ImageChops.subtract_modulo(block, average),
+        ]
+
+    def choose_filters(self, candidates):
+        """Picks the filter with the smallest sum of absolute values for each row, as libpng does"""
+        height = candidates[0].height
+        scores = []
+        for candidate in candidates:
+            row_score = [0.0] * height
+            for channel in candidate.point(SIGNED_ABS_LUT).split():
+                means = array.array('f', channel.convert('F').resize((1, height), Image.BOX).tobytes())
+                row_score = [score + mean for score, mean in zip(row_score, means)]
+            scores.append(row_score)
+        return [min(range(len(candidates)), key=lambda f: scores[f][row]) for row in range(height)]
+
+    def add_compressed(self, data):
+        if not data:
+            return
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size >= self.CHUNK_SIZE:
+            self.flush_pending()
+
+    def flush_pending(self):
+        if self.pending:
+            self.write_chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def finish(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Only {self.rows_written} of {self.height} rows were written.")
+        self.add_compressed(self.compressor.flush())
+        self.flush_pending()
+        self.write_chunk(b'IEND', b'')
@@ -0,0 +1,72 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+
+
+class PreviewStore:
+    """Composited preview buffer owned by a QImage, so Qt paints from it without a copy"""
+    BYTES_PER_PIXEL = 4
+
+    def __init__(self, grid_size, tile_size):
+        self.grid_size = grid_size
+        self.tile_size = tile_size
+        self.width = self.height = grid_size * tile_size
+        self.qimage = QtGui.QImage(self.width, self.height, QtGui.QImage.Format_RGBX8888)
+        self.bytes_per_line = self.qimage.bytesPerLine()
+        # A writable view of the QImage's own pixels. The image is never copied, so Qt does not detach
+        # it and the view stays valid until release()
+        pixels = self.qimage.bits()
+        pixels.setsize(self.qimage.sizeInBytes())
+        self.buffer = memoryview(pixels)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def matches(self, grid_size, tile_size):
+        return self.grid_size == grid_size and self.tile_size == tile_size
+
+    def fill(self, background_color):
+        self.qimage.fill(QtGui.QColor(background_color))
+
+    def tile_rect(self, x, y):
+        return QtCore.QRect(x * self.tile_size, y * self.tile_size, self.tile_size, self.tile_size)
+
+    def paste_tile(self, x, y, image, background_color=None):
+        """Writes one scaled tile into the shared buffer and returns the rectangle that changed"""
+        rect = self.tile_rect(x, y)
+        painter = QtGui.QPainter(self.qimage)
+        try:
+            painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+            if image is None:
+                painter.fillRect(rect, QtGui.QColor(background_color))
+            else:
+                if image.mode != 'RGBX':
+                    image = image.convert('RGBX')
+                data = image.tobytes()
+                tile = QtGui.QImage(data, image.width, image.height, image.width * self.BYTES_PER_PIXEL,
+                                    QtGui.QImage.Format_RGBX8888)
+                painter.drawImage(rect.topLeft(), tile)
+        finally:
+            painter.end()
+        return rect
+
+    def release(self):
+        """Drops the view of the pixels before the QImage that owns them"""
+        self.buffer.release()
+        self.buffer = None
+        self.qimage = None
+
+
+class PreviewItem(QtWidgets.QGraphicsItem):
+    """Scene item that paints straight from the preview store, without converting it to a QPixmap"""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QtCore.QRectF(0, 0, self.store.width, self.store.height)
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.toAlignedRect().intersected(self.boundingRect().toRect())
+        painter.drawImage(exposed, self.store.qimage, exposed)
@@ -7,11 +7,13 @@ from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtWidgets import QMessageBox
+from planner import MemoryPlanner, default_memory_budget_mb, CANVAS_BYTES_PER_PIXEL, DECODED_BYTES_PER_PIXEL, ENCODER_BASE_BYTES
+from png_stream import StreamingPNGWriter
+from tile_cache import open_tile
 
 class ImageStitcherLogic:
     def main(self, grid_size, trim_pixels, image_directory, output_path, prefix, background_color):
         try:
-            images = {}
             self.update_status("Loading image list...")
             self.stitching_progress_bar.setValue(0)
             self.stitching_progress_bar.setMaximum(grid_size * grid_size)
@@ -22,26 +24,17 @@ class ImageStitcherLogic:
             if not available_png_files:
                 raise ValueError("No images found matching the specified prefix and extension in the directory.")
 
-            self.load_images_multithreaded(available_png_files, trim_pixels, images)
-
-            sample_image = next(iter(images.values()))
-            image_width, image_height = sample_image.size
-            stitched_image = Image.new('RGB', (image_width * grid_size, image_height * grid_size), background_color)
-
-            for x in range(grid_size):
-                for y in range(grid_size):
-                    if (x, y) in images:
-                        self.update_status(f"Stitching image at position ({x}, {y})...")
-                        stitched_image.paste(images[(x, y)], (x * image_width, y * image_height))
-                    else:
-                        self.update_status(f"Generating blank image at position ({x}, {y})...")
-
-                    self.stitching_progress_bar.setValue(self.stitching_progress_bar.value() + 1)
-                    QtWidgets.QApplication.processEvents()
+            planner = self.get_memory_planner()
+            source_tile_size = planner.probe_tile_size(available_png_files)
+            plan = planner.plan_merge(grid_size, source_tile_size, trim_pixels, output_path, len(available_png_files))
+            if not self.confirm_plan(plan):
+                self.update_status("Merge cancelled.")
+                return
 
-            self.update_status("Process completed. Saving image...")
-
-            stitched_image.save(output_path)
+            if plan.strategy == 'banded':
+                self.stitch_banded(plan, available_png_files, grid_size, trim_pixels, output_path, background_color)
+            else:
+                self.stitch_in_memory(plan, available_png_files, grid_size, trim_pixels, output_path, background_color)
             self.update_status("Process completed. Image saved!")
             
             QMessageBox.information(self, "Success", f"Image saved as {output_path}!")
@@ -50,6 +43,91 @@ class ImageStitcherLogic:
             QMessageBox.critical(self, "Error", f"An error occurred: {e}")
             print(f"Error: An error occurred: {e}")
 
+    def stitch_in_memory(self, plan, available_png_files, grid_size, trim_pixels, output_path, background_color):
+        images = {}
+        self.load_images_multithreaded(available_png_files, trim_pixels, images, plan.workers)
+
+        sample_image = next(iter(images.values()))
+        image_width, image_height = sample_image.size
+        stitched_image = Image.new('RGB', (image_width * grid_size, image_height * grid_size), background_color)
+
+        for x in range(grid_size):
+            for y in range(grid_size):
+                if (x, y) in images:
+                    self.update_status(f"Stitching image at position ({x}, {y})...")
+                    stitched_image.paste(images[(x, y)], (x * image_width, y * image_height))
+                else:
+                    self.update_status(f"Generating blank image at position ({x}, {y})...")
+
+                self.stitching_progress_bar.setValue(self.stitching_progress_bar.value() + 1)
+                QtWidgets.QApplication.processEvents()
+
+        self.update_status("Process completed. Saving image...")
+
+        stitched_image.save(output_path)
+
+    def stitch_banded(self, plan, available_png_files, grid_size, trim_pixels, output_path, background_color):
+        """Stitches and writes the image one band of tile rows at a time"""
+        tile_width, tile_height = plan.tile_size
+        canvas_width, canvas_height = plan.canvas_size
+
+        files_by_row = {}
+        for filename, image_directory in available_png_files:
+            position = self.get_tile_position(filename)
+            if position and position[0] < grid_size and position[1] < grid_size:
+                files_by_row.setdefault(position[1], []).append((filename, image_directory))
+
+        self.stitching_progress_bar.setValue(0)
+        self.stitching_progress_bar.setMaximum(sum(len(files) for files in files_by_row.values()))
+        loaded_count = 0
+
+        with StreamingPNGWriter(output_path, canvas_width, canvas_height) as writer:
+            for band_start in range(0, grid_size, plan.band_rows):
+                band_end = min(band_start + plan.band_rows, grid_size)
+                self.update_status(f"Stitching rows {band_start}-{band_end - 1} of {grid_size}...")
+
+                band_files = []
+                for y in range(band_start, band_end):
+                    band_files.extend(files_by_row.get(y, []))
+
+                images = {}
+                if band_files:
+                    self.load_images_multithreaded(band_files, trim_pixels, images, plan.workers, loaded_count)
+                    loaded_count += len(band_files)
+
+                band = Image.new('RGB', (canvas_width, (band_end - band_start) * tile_height), background_color)
+                for (x, y), img in images.items():
+                    band.paste(img, (x * tile_width, (y - band_start) * tile_height))
+                images.clear()
+
+                writer.write_band(band)
+                band.close()
+                QtWidgets.QApplication.processEvents()
+
+    def get_memory_planner(self):
+        try:
+            max_workers = int(self.workers_entry.text())
+        except (ValueError, AttributeError):
+            max_workers = 4
+        try:
+            budget_mb = int(self.memory_budget_entry.text())
+        except (ValueError, AttributeError):
+            budget_mb = default_memory_budget_mb()
+        return MemoryPlanner(budget_mb, max_workers)
+
+    def confirm_plan(self, plan):
+        """Reports the chosen plan and asks before running a job predicted to exceed the budget"""
+        self.update_status(plan.describe())
+        if plan.fits:
+            return True
+        reply = QMessageBox.question(self, "Memory Budget",
+            f"{plan.describe()}\n\n"
+            "The job is predicted to use more memory than the configured budget.\n"
+            "Do you want to continue anyway?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No)
+        return reply == QMessageBox.Yes
+
     def run_stitching(self):
         try:
             grid_size = int(self.grid_size_entry.text())
@@ -76,6 +154,13 @@ class ImageStitcherLogic:
             QMessageBox.critical(self, "Error", str(e))
             print(f"Error: {e}")
 
+    def get_tile_position(self, filename):
+        try:
+            _, x_str, y_str, _ = filename.split('_')
+            return int(x_str), int(y_str)
+        except ValueError:
+            return None
+
     def load_single_image(self, args):
         """Loads a single image (for multithreading)"""
         filename, image_directory, trim_pixels = args
@@ -86,7 +171,7 @@ class ImageStitcherLogic:
             y = int(y_str)
 
             image_path = os.path.join(image_directory, filename)
-            img = Image.open(image_path)
+            img = open_tile(image_path)
             width, height = img.size
             cropped_img = img.crop((trim_pixels, trim_pixels, width - trim_pixels, height - trim_pixels))
             
@@ -94,20 +179,20 @@ class ImageStitcherLogic:
         except Exception as e:
             return None, None, f"Error loading {filename}: {e}"
     
-    def load_images_multithreaded(self, available_png_files, trim_pixels, images):
+    def load_images_multithreaded(self, available_png_files, trim_pixels, images, workers=4, progress_offset=0):
         """Loads images using multithreading"""
         load_args = []
         for filename, image_directory in available_png_files:
             load_args.append((filename, image_directory, trim_pixels))
         
-        max_workers = min(4, len(load_args))
+        max_workers = max(1, min(workers, len(load_args)))
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = [executor.submit(self.load_single_image, args) for args in load_args]
             
             for i, future in enumerate(futures):
                 self.update_status(f"Loading images... ({i + 1}/{len(futures)})")
-                self.stitching_progress_bar.setValue(i + 1)
+                self.stitching_progress_bar.setValue(progress_offset + i + 1)
                 QtWidgets.QApplication.processEvents()
                 
                 position, cropped_img, error = future.result()
@@ -135,27 +220,26 @@ class ImageStitcherLogic:
             if not available_png_files:
                 raise ValueError("No images found matching the specified prefix.")
 
+            planner = self.get_memory_planner()
+            width, height = planner.probe_tile_size(available_png_files)
+            plan = planner.plan_preview(grid_size, (width, height), trim_pixels, preview_quality, len(available_png_files))
+            if not self.confirm_plan(plan):
+                self.update_status("Preview cancelled.")
+                return
+
             self.preview_progress_bar.setMaximum(len(available_png_files))
 
-            self.load_preview_images_multithreaded(available_png_files, trim_pixels, preview_quality, images)
+            self.load_preview_images_multithreaded(available_png_files, trim_pixels, preview_quality, images, plan.workers)
 
-            preview_image = Image.new('RGB', (preview_quality * grid_size, preview_quality * grid_size), background_color)
-            for x in range(grid_size):
-                for y in range(grid_size):
-                    if (x, y) in images:
-                        preview_image.paste(images[(x, y)], (x * preview_quality, y * preview_quality))
+            preview_store = self.get_preview_store(grid_size, preview_quality)
+            preview_store.fill(background_color)
+            for (x, y), scaled_img in images.items():
+                if x < grid_size and y < grid_size:
+                    preview_store.paste_tile(x, y, scaled_img)
+            images.clear()
 
-            if available_png_files:
-                first_filename, first_directory = available_png_files[0]
-                first_path = os.path.join(first_directory, first_filename)
-                temp_img = Image.open(first_path)
-                width, height = temp_img.size
-                temp_img.close()
-            else:
-                width, height = 512, 512
-
-            self.render_preview(preview_image)
-            self.update_preview_info(preview_image, (width * grid_size, height * grid_size))
+            self.render_preview(preview_store)
+            self.update_preview_info(preview_store, (width * grid_size, height * grid_size))
             self.update_status("Preview loaded.")
                 
         except ValueError as ve:
@@ -165,6 +249,161 @@ class ImageStitcherLogic:
             QMessageBox.critical(self, "Error", f"Error loading preview: {e}")
             print(f"Error: Error loading preview: {e}")
 
+    def apply_tile_changes(self, changed, removed):
+        """Converts and re-decodes only the tiles that changed on disk, then patches them into the preview and output"""
+        self.watch_pending.update(changed)
+        self.watch_pending.update(removed)
+        if self.watch_busy:
+            return
+        if self.conversion_busy:
+            # Try again once the running conversion has finished
+            QtCore.QTimer.singleShot(500, lambda: self.apply_tile_changes([], []))
+            return
+
+        self.watch_busy = True
+        try:
+            while self.watch_pending:
+                filenames = sorted(self.watch_pending)
+                self.watch_pending.clear()
+                self.update_changed_tiles(filenames)
+        except Exception as e:
+            print(f"Error while updating changed tiles: {e}")
+            self.update_status(f"Error while updating changed tiles: {e}")
+        finally:
+            self.watch_busy = False
+
+    def update_changed_tiles(self, filenames):
+        image_directory = self.image_directory_entry.text()
+        grid_size = int(self.grid_size_entry.text())
+        trim_pixels = int(self.trim_pixels_entry.text())
+        preview_quality = int(self.preview_quality_entry.text())
+        prefix = self.prefix_var.currentText()
+        background_color = self.color_var.text()
+
+        output_path = self.output_path_entry.text()
+        output_name = os.path.basename(output_path) if output_path else None
+        filenames = [f for f in filenames if f.startswith(prefix) and f != output_name]
+        if not filenames:
+            return
+        self.update_status(f"Detected {len(filenames)} changed tiles...")
+
+        paa_files = [f for f in filenames if f.endswith(".paa") and os.path.exists(os.path.join(image_directory, f))]
+        removed_paa_files = [f for f in filenames if f.endswith(".paa") and f not in paa_files]
+        namespace = self.tile_cache.find_namespace(image_directory)
+        if removed_paa_files and namespace is not None:
+            for paa_file in removed_paa_files:
+                self.tile_cache.remove(namespace, paa_file)
+                self.current_paa_cache.pop(paa_file, None)
+            self.tile_cache.save_index()
+        failed_paa_files = paa_files
+        if paa_files:
+            if self.imagetopaa_path:
+                self.convert_paa_to_png(paa_files, image_directory)
+                failed_paa_files = self.find_stale_tiles(image_directory, paa_files)
+            else:
+                self.update_status("ImageToPAA path is not set, changed .paa files were skipped.")
+        # A .paa that failed to convert still has its previous tile in the cache, keep those cells as they are
+        stale_names = {os.path.splitext(f)[0] for f in failed_paa_files}
+
+        positions = {}
+        skipped = 0
+        for filename in filenames:
+            position = self.get_tile_position(filename)
+            if position and position[0] < grid_size and position[1] < grid_size:
+                tile_name = os.path.splitext(filename)[0]
+                if tile_name in stale_names and not os.path.exists(os.path.join(image_directory, tile_name + ".png")):
+                    skipped += 1
+                    continue
+                positions[position] = tile_name
+        if not positions:
+            if skipped:
+                self.update_status(f"Updated 0 tiles, {skipped} failed to convert.")
+            return
+
+        tile_files = self.resolve_tile_files(image_directory, positions.values())
+
+        planner = self.get_memory_planner()
+        workers = 1
+        if tile_files:
+            source_tile_size = planner.probe_tile_size(tile_files)
+            workers = planner.plan_preview(grid_size, source_tile_size, trim_pixels, preview_quality, len(tile_files)).workers
+
+        if self.preview_store is None or not self.preview_store.matches(grid_size, preview_quality):
+            self.reload_preview()
+        else:
+            images = {}
+            self.load_preview_images_multithreaded(tile_files, trim_pixels, preview_quality, images, workers)
+            self.update_preview_tiles({position: images.get(position) for position in positions}, background_color)
+
+        if self.update_output_checkbox.isChecked() and output_path and os.path.exists(output_path):
+            self.patch_output(planner, workers, tile_files, list(positions), grid_size, trim_pixels, output_path, background_color)
+
+        if skipped:
+            self.update_status(f"Updated {len(positions)} tiles, {skipped} failed to convert.")
+        else:
+            self.update_status(f"Updated {len(positions)} tiles.")
+
+    def find_stale_tiles(self, image_directory, paa_files):
+        """Returns the .paa files whose cached tile does not match the file on disk after a conversion"""
+        namespace = self.tile_cache.find_namespace(image_directory)
+        if namespace is None:
+            return list(paa_files)
+        return [paa_file for paa_file in paa_files
+                if not self.tile_cache.is_current(namespace, paa_file, self.get_file_hash(os.path.join(image_directory, paa_file)))]
+
+    def resolve_tile_files(self, image_directory, tile_names):
+        """Finds the file used for each tile, a PNG next to the sources wins over a converted .paa"""
+        namespace = self.tile_cache.find_namespace(image_directory)
+        tile_files = []
+        for tile_name in tile_names:
+            png_file = tile_name + ".png"
+            tile_file = self.tile_cache.tile_filename(tile_name + ".paa")
+            if os.path.exists(os.path.join(image_directory, png_file)):
+                tile_files.append((png_file, image_directory))
+            elif (namespace is not None and os.path.exists(os.path.join(image_directory, tile_name + ".paa")) and
+                  os.path.exists(os.path.join(self.tile_cache.namespace_dir(namespace), tile_file))):
+                tile_files.append((tile_file, self.tile_cache.namespace_dir(namespace)))
+        return tile_files
+
+    def patch_output(self, planner, workers, tile_files, positions, grid_size, trim_pixels, output_path, background_color):
+        """Pastes changed tiles into an existing merged image instead of merging the whole map again"""
+        temp_path = output_path + ".part"
+        with Image.open(output_path) as output:
+            width, height = output.size
+            output_format = output.format
+            tile_width, tile_height = width // grid_size, height // grid_size
+            # The decoded output, a converted copy unless it is already RGB, the changed tiles and the encoder buffers
+            copies = 1 if output.mode == 'RGB' else 2
+            needed = (copies * width * height * DECODED_BYTES_PER_PIXEL
+                      + len(tile_files) * tile_width * tile_height * DECODED_BYTES_PER_PIXEL
+                      + ENCODER_BASE_BYTES + 2 * width * CANVAS_BYTES_PER_PIXEL)
+            if needed > planner.budget_bytes:
+                self.update_status("Output is too large to update within the memory budget, use 'Merge Images' to rebuild it.")
+                return
+
+            output.load()
+            stitched_image = output if output.mode == 'RGB' else output.convert('RGB')
+
+            images = {}
+            self.load_images_multithreaded(tile_files, trim_pixels, images, workers)
+            for x, y in positions:
+                box = (x * tile_width, y * tile_height, (x + 1) * tile_width, (y + 1) * tile_height)
+                if (x, y) in images:
+                    stitched_image.paste(images[(x, y)], box[:2])
+                else:
+                    stitched_image.paste(background_color, box)
+            images.clear()
+
+            self.update_status("Saving updated output...")
+            # Write next to the output and swap it in, so a failed save leaves the previous merge intact
+            try:
+                stitched_image.save(temp_path, format=output_format)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        os.replace(temp_path, output_path)
+
     def load_single_preview_image(self, args):
         """Loads a single image for preview (for multithreading)"""
         filename, image_directory, trim_pixels, preview_quality = args
@@ -175,7 +414,7 @@ class ImageStitcherLogic:
             y = int(y_str)
 
             image_path = os.path.join(image_directory, filename)
-            img = Image.open(image_path)
+            img = open_tile(image_path)
             width, height = img.size
             cropped_img = img.crop((trim_pixels, trim_pixels, width - trim_pixels, height - trim_pixels))
             scaled_img = cropped_img.resize((preview_quality, preview_quality))
@@ -184,13 +423,13 @@ class ImageStitcherLogic:
         except Exception as e:
             return None, None, f"Error loading preview {filename}: {e}"
     
-    def load_preview_images_multithreaded(self, available_png_files, trim_pixels, preview_quality, images):
+    def load_preview_images_multithreaded(self, available_png_files, trim_pixels, preview_quality, images, workers=4):
         """Loads images for preview using multithreading"""
         load_args = []
         for filename, image_directory in available_png_files:
             load_args.append((filename, image_directory, trim_pixels, preview_quality))
         
-        max_workers = min(4, len(load_args))
+        max_workers = max(1, min(workers, len(load_args)))
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = [executor.submit(self.load_single_preview_image, args) for args in load_args]
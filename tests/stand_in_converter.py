@@ -0,0 +1,49 @@
+"""Stand-in for ImageToPAA used by the tests.
+
+The source file holds one directive per line:
+    sleep=<seconds>      wait before converting
+    fail_times=<count>   fail this many attempts before succeeding
+Every run appends "start <time>" and "end <time>" to <output>.log and writes its pid to <output>.pid.
+"""
+import os
+import sys
+import time
+
+
+def main():
+    source_path, output_path = sys.argv[1:3]
+    options = {}
+    with open(source_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if '=' in line:
+                key, value = line.strip().split('=', 1)
+                options[key] = float(value)
+
+    with open(output_path + '.pid', 'w') as f:
+        f.write(str(os.getpid()))
+    with open(output_path + '.log', 'a') as f:
+        f.write(f"start {time.time()}\n")
+
+    attempts_path = output_path + '.attempts'
+    attempts = 0
+    if os.path.exists(attempts_path):
+        with open(attempts_path) as f:
+            attempts = int(f.read())
+    with open(attempts_path, 'w') as f:
+        f.write(str(attempts + 1))
+
+    time.sleep(options.get('sleep', 0))
+    with open(output_path + '.log', 'a') as f:
+        f.write(f"end {time.time()}\n")
+
+    if attempts < options.get('fail_times', 0):
+        sys.stderr.write(f"stand-in failure {attempts + 1}")
+        return 1
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(source_path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+
+import converter
+from converter import ConversionJob, ConversionScheduler, build_command
+
+STAND_IN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stand_in_converter.py')
+
+
+def make_job(tmp_path, key, **options):
+    source_path = tmp_path / f"{key}.paa"
+    source_path.write_text(''.join(f"{name}={value}\n" for name, value in options.items()), encoding='utf-8')
+    return ConversionJob(key, str(source_path), str(tmp_path / f"{key}.png"))
+
+
+def make_scheduler(max_workers=4, **kwargs):
+    scheduler = ConversionScheduler(build_command(STAND_IN), max_workers, **kwargs)
+    # The starting limit follows the CPU count, start from the maximum so the tests do not depend on the machine
+    scheduler.limit = scheduler.max_workers
+    return scheduler
+
+
+def test_build_command_runs_python_stand_in_with_interpreter():
+    command = build_command(STAND_IN)
+    assert command[-1] == STAND_IN
+    assert len(command) == 2
+    assert build_command('ImageToPAA.exe') == ['ImageToPAA.exe']
+
+
+def test_results_are_reported_in_completion_order(tmp_path):
+    jobs = [make_job(tmp_path, 'slow', sleep=1.0), make_job(tmp_path, 'fast')]
+    order = []
+
+    results = make_scheduler().run(jobs, on_result=lambda job, success: order.append(job.key))
+
+    assert order == ['fast', 'slow']
+    assert results == {'fast': True, 'slow': True}
+    assert (tmp_path / 'fast.png').read_text(encoding='utf-8') == 'fast.paa'
+
+
+def test_timed_out_conversion_is_killed(tmp_path):
+    job = make_job(tmp_path, 'stuck', sleep=30)
+    started = time.monotonic()
+
+    results = make_scheduler(timeout=0.5, retries=0).run([job])
+
+    assert results == {'stuck': False}
+    assert 'Timeout' in job.error
+    assert time.monotonic() - started < 10
+    pid = int((tmp_path / 'stuck.png.pid').read_text())
+    try:
+        os.kill(pid, 0)
+        alive = True
+    except OSError:
+        alive = False
+    assert not alive
+
+
+def test_failed_conversion_is_retried(tmp_path):
+    job = make_job(tmp_path, 'flaky', fail_times=1)
+
+    results = make_scheduler(retries=2).run([job])
+
+    assert results == {'flaky': True}
+    assert job.attempts == 2
+
+
+def test_retries_are_bounded(tmp_path):
+    job = make_job(tmp_path, 'broken', fail_times=10)
+    reported = []
+
+    results = make_scheduler(retries=2).run([job], on_result=lambda job, success: reported.append(success))
+
+    assert results == {'broken': False}
+    assert reported == [False]
+    assert job.attempts == 3
+    assert 'stand-in failure 3' in job.error
+
+
+def test_running_conversions_never_exceed_max_workers(tmp_path):
+    jobs = [make_job(tmp_path, f"tile{i}", sleep=0.3) for i in range(6)]
+
+    make_scheduler(max_workers=2).run(jobs)
+
+    events = []
+    for job in jobs:
+        for line in open(job.output_path + '.log'):
+            kind, stamp = line.split()
+            events.append((float(stamp), 1 if kind == 'start' else -1))
+    running = peak = 0
+    for _, change in sorted(events, key=lambda event: (event[0], event[1])):
+        running += change
+        peak = max(peak, running)
+    assert peak <= 2
+
+
+def test_concurrency_grows_while_throughput_improves(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(converter.time, 'monotonic', lambda: clock[0])
+    scheduler = make_scheduler(max_workers=16)
+    scheduler.limit = 2
+    scheduler.window_start = 0.0
+
+    for step in (1.0, 0.5):
+        clock[0] += step
+        for _ in range(scheduler.THROUGHPUT_WINDOW):
+            scheduler.record_completion()
+
+    assert scheduler.limit == 4
+
+
+def test_concurrency_shrinks_when_throughput_drops(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(converter.time, 'monotonic', lambda: clock[0])
+    scheduler = make_scheduler(max_workers=16)
+    scheduler.limit = 6
+    scheduler.window_start = 0.0
+    scheduler.last_throughput = scheduler.THROUGHPUT_WINDOW / 1.0
+
+    clock[0] += 4.0
+    for _ in range(scheduler.THROUGHPUT_WINDOW):
+        scheduler.record_completion()
+
+    assert scheduler.limit == 5
+
+
+def test_timeouts_halve_concurrency():
+    scheduler = make_scheduler(max_workers=16)
+    scheduler.limit = 8
+
+    scheduler.decrease_limit()
+    scheduler.decrease_limit()
+    scheduler.decrease_limit()
+    scheduler.decrease_limit()
+
+    assert scheduler.limit == 1
+
+
+def test_process_exiting_as_timeout_fires_does_not_drop_other_jobs(tmp_path, monkeypatch):
+    original_kill = asyncio.subprocess.Process.kill
+
+    def kill_after_exit(process):
+        original_kill(process)
+        raise ProcessLookupError()
+
+    monkeypatch.setattr(asyncio.subprocess.Process, 'kill', kill_after_exit)
+    jobs = [make_job(tmp_path, 'stuck', sleep=30), make_job(tmp_path, 'fine')]
+
+    results = make_scheduler(timeout=0.5, retries=0).run(jobs)
+
+    assert results == {'stuck': False, 'fine': True}
+    assert 'Timeout' in jobs[0].error
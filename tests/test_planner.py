@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip('PIL')
+
+from planner import MemoryPlanner
+
+MB = 1024 * 1024
+
+
+def test_small_map_is_merged_in_memory():
+    plan = MemoryPlanner(4096, 8).plan_merge(4, (512, 512), 16, 'map.png', 16)
+
+    assert plan.strategy == 'in-memory'
+    assert plan.workers == 8
+    assert plan.canvas_size == (1920, 1920)
+    assert plan.fits
+
+
+def test_large_png_map_is_merged_in_bands():
+    plan = MemoryPlanner(4096, 8).plan_merge(64, (2048, 2048), 16, 'map.png', 4096)
+
+    assert plan.strategy == 'banded'
+    assert 1 <= plan.band_rows < 64
+    assert plan.band_height == plan.band_rows * 2016
+    assert plan.fits
+
+
+def test_larger_budget_gives_taller_bands():
+    small = MemoryPlanner(2048, 4).plan_merge(32, (1024, 1024), 0, 'map.png', 1024)
+    large = MemoryPlanner(4096, 4).plan_merge(32, (1024, 1024), 0, 'map.png', 1024)
+
+    assert small.strategy == large.strategy == 'banded'
+    assert small.band_rows < large.band_rows
+
+
+def test_non_png_output_falls_back_to_in_memory():
+    plan = MemoryPlanner(2048, 8).plan_merge(64, (2048, 2048), 16, 'map.jpg', 4096)
+
+    assert plan.strategy == 'in-memory'
+    assert not plan.fits
+    assert "over budget" in plan.describe()
+
+
+def test_workers_shrink_to_fit_budget():
+    planner = MemoryPlanner(1, 64)
+    # Each worker holds a decoded and a cropped 256x256 tile, 512 KB together
+    plan = planner.plan_preview(1, (256, 256), 0, 16, 1)
+    assert plan.workers == 1
+
+    roomy = MemoryPlanner(64, 64).plan_merge(2, (256, 256), 0, 'map.png', 4)
+    tight_budget_mb = (roomy.peak_bytes - 3 * 512 * 1024) // MB + 1
+    tight = MemoryPlanner(tight_budget_mb, 64).plan_merge(2, (256, 256), 0, 'map.png', 4)
+
+    assert roomy.workers == 4
+    assert tight.workers < roomy.workers
+    assert tight.fits
+
+
+def test_trim_larger_than_tile_is_rejected():
+    with pytest.raises(ValueError):
+        MemoryPlanner(1024, 4).plan_merge(4, (16, 16), 8, 'map.png', 16)
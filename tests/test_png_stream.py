@@ -0,0 +1,75 @@
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+from PIL import ImageChops, ImageFilter
+
+from png_stream import StreamingPNGWriter
+
+
+def noise_image(width, height):
+    return Image.effect_noise((width, height), 90).convert('RGB').point(lambda value: (value * 37) % 256)
+
+
+def write_in_bands(path, image, band_heights):
+    with StreamingPNGWriter(str(path), image.width, image.height) as writer:
+        top = 0
+        for band_height in band_heights:
+            writer.write_band(image.crop((0, top, image.width, top + band_height)))
+            top += band_height
+
+
+def assert_same_pixels(path, image):
+    with Image.open(path) as written:
+        written.load()
+        assert written.size == image.size
+        assert ImageChops.difference(written.convert('RGB'), image).getbbox() is None
+
+
+def test_round_trip_across_unaligned_bands(tmp_path):
+    image = noise_image(53, 150)
+    path = tmp_path / 'out.png'
+
+    write_in_bands(path, image, [37, 70, 43])
+
+    assert_same_pixels(path, image)
+
+
+@pytest.mark.parametrize('png_filter', [0, 1, 2, 3])
+def test_round_trip_with_each_filter(tmp_path, monkeypatch, png_filter):
+    # Noise with odd neighbour sums checks the rounding of the Average filter
+    image = noise_image(31, 90)
+    monkeypatch.setattr(StreamingPNGWriter, 'choose_filters',
+                        lambda self, candidates: [png_filter] * candidates[0].height)
+    path = tmp_path / 'out.png'
+
+    write_in_bands(path, image, [50, 40])
+
+    assert_same_pixels(path, image)
+
+
+def test_filtering_makes_smooth_images_smaller_than_unfiltered(tmp_path, monkeypatch):
+    # Blurred noise looks like terrain: neighbouring pixels are close but no two rows repeat
+    image = Image.merge('RGB', [Image.effect_noise((256, 256), 80).filter(ImageFilter.GaussianBlur(3))
+                                for _ in range(3)])
+    filtered_path = tmp_path / 'filtered.png'
+    unfiltered_path = tmp_path / 'unfiltered.png'
+
+    write_in_bands(filtered_path, image, [256])
+    monkeypatch.setattr(StreamingPNGWriter, 'choose_filters', lambda self, candidates: [0] * candidates[0].height)
+    write_in_bands(unfiltered_path, image, [256])
+
+    assert filtered_path.stat().st_size < unfiltered_path.stat().st_size
+    assert_same_pixels(filtered_path, image)
+
+
+def test_finish_raises_when_rows_are_missing(tmp_path):
+    image = noise_image(10, 20)
+
+    with pytest.raises(ValueError, match="Only 10 of 20 rows"):
+        write_in_bands(tmp_path / 'out.png', image, [10])
+
+
+def test_band_wider_than_image_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="does not match"):
+        with StreamingPNGWriter(str(tmp_path / 'out.png'), 10, 10) as writer:
+            writer.write_band(noise_image(11, 10))
@@ -0,0 +1,62 @@
+import ctypes
+
+import pytest
+
+QtGui = pytest.importorskip('PyQt5.QtGui')
+Image = pytest.importorskip('PIL.Image')
+
+from preview_store import PreviewStore
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])
+
+
+def buffer_address(store):
+    return ctypes.addressof(ctypes.c_char.from_buffer(store.buffer))
+
+
+def pixel_bytes(store, x, y):
+    offset = y * store.bytes_per_line + x * PreviewStore.BYTES_PER_PIXEL
+    return bytes(store.buffer[offset:offset + 3])
+
+
+def test_buffer_is_the_qimage_pixels_after_fill_and_paste(app):
+    store = PreviewStore(2, 8)
+    address = buffer_address(store)
+    assert address == int(store.qimage.constBits())
+
+    store.fill('#102030')
+    assert int(store.qimage.constBits()) == address
+    assert pixel_bytes(store, 15, 15) == b'\x10\x20\x30'
+
+    store.paste_tile(1, 0, Image.new('RGB', (8, 8), (255, 0, 0)))
+    assert int(store.qimage.constBits()) == address
+    assert pixel_bytes(store, 9, 1) == b'\xff\x00\x00'
+    assert pixel_bytes(store, 1, 1) == b'\x10\x20\x30'
+    store.release()
+
+
+def test_paste_without_image_clears_tile_to_background(app):
+    store = PreviewStore(2, 4)
+    store.fill('#000000')
+    store.paste_tile(0, 1, Image.new('RGBA', (4, 4), (1, 2, 3, 0)))
+    assert pixel_bytes(store, 1, 5) == b'\x01\x02\x03'
+
+    rect = store.paste_tile(0, 1, None, '#0a0b0c')
+
+    assert (rect.x(), rect.y(), rect.width(), rect.height()) == (0, 4, 4, 4)
+    assert pixel_bytes(store, 1, 5) == b'\x0a\x0b\x0c'
+    store.release()
+
+
+def test_release_drops_buffer_before_image(app):
+    store = PreviewStore(1, 4)
+    view = store.buffer
+
+    store.release()
+
+    assert store.buffer is None and store.qimage is None
+    with pytest.raises(ValueError):
+        view[0]
@@ -0,0 +1,155 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import tile_cache
+from tile_cache import TileCache, read_tile, write_tile
+
+MB = 1024 * 1024
+
+
+def make_cache(tmp_path, limit_mb=16):
+    return TileCache(str(tmp_path / 'cache'), limit_mb)
+
+
+def store_tile(cache, namespace, name, size=64, color=(10, 20, 30)):
+    return cache.store(namespace, f"{name}.paa", Image.new('RGB', (size, size), color), f"hash-{name}")
+
+
+def cached_names(cache):
+    return sorted(key.split('/')[1] for key in cache.index['entries'])
+
+
+@pytest.mark.parametrize('mode, color', [('RGB', (1, 2, 3)), ('RGBA', (4, 5, 6, 7))])
+def test_tile_round_trip(tmp_path, mode, color):
+    image = Image.new(mode, (5, 3), color)
+    image.putpixel((4, 2), tuple(reversed(color)))
+    path = str(tmp_path / 'tile.tile')
+
+    size = write_tile(path, image)
+
+    assert size == os.path.getsize(path)
+    assert not os.path.exists(path + '.part')
+    tile = read_tile(path)
+    assert tile.mode == mode and tile.size == (5, 3)
+    assert tile.tobytes() == image.tobytes()
+
+
+def test_read_rejects_other_files(tmp_path):
+    path = tmp_path / 'tile.tile'
+    path.write_bytes(b'\x00' * 64)
+
+    with pytest.raises(ValueError):
+        read_tile(str(path))
+
+
+def test_namespaces_are_only_created_on_request(tmp_path):
+    cache = make_cache(tmp_path)
+    image_directory = str(tmp_path / 'maps' / 'chernarus')
+
+    assert cache.find_namespace(image_directory) is None
+    assert not cache.dirty
+
+    namespace = cache.namespace_for(image_directory)
+
+    assert cache.find_namespace(image_directory) == namespace
+    assert cache.find_namespace(str(tmp_path / 'maps' / 'livonia')) != namespace
+    assert os.path.isdir(cache.namespace_dir(namespace))
+    assert cache.dirty
+
+
+def test_least_recently_used_tiles_are_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    namespace = cache.namespace_for(str(tmp_path / 'map'))
+    for age, name in enumerate(['old', 'middle', 'new']):
+        store_tile(cache, namespace, name, size=1024)
+        cache.index['entries'][cache.entry_key(namespace, f"{name}.paa")]['last_used'] = age
+    cache.set_limit(8)
+
+    store_tile(cache, namespace, 'latest', size=1024)
+
+    # Four 3 MB tiles with an 8 MB limit, the two oldest have to go
+    assert cached_names(cache) == ['latest.tile', 'new.tile']
+    assert not os.path.exists(os.path.join(cache.namespace_dir(namespace), 'old.tile'))
+    assert cache.total_size() <= 8 * MB
+
+
+def test_pinned_tiles_are_not_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    namespace = cache.namespace_for(str(tmp_path / 'map'))
+    for age, name in enumerate(['old', 'middle', 'new']):
+        store_tile(cache, namespace, name, size=1024)
+        cache.index['entries'][cache.entry_key(namespace, f"{name}.paa")]['last_used'] = age
+    keys = cache.pin(namespace, ['old.paa'])
+    cache.set_limit(8)
+
+    store_tile(cache, namespace, 'latest', size=1024)
+
+    # The next oldest tiles are evicted in place of the pinned one
+    assert cached_names(cache) == ['latest.tile', 'old.tile']
+
+    cache.unpin(keys)
+    cache.set_limit(4)
+    cache.evict()
+
+    assert cached_names(cache) == ['latest.tile']
+
+
+def test_access_times_are_refreshed_at_most_once_per_interval(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(tile_cache.time, 'time', lambda: clock[0])
+    cache = make_cache(tmp_path)
+    namespace = cache.namespace_for(str(tmp_path / 'map'))
+    store_tile(cache, namespace, 'tile')
+    cache.save_index()
+    entry = cache.index['entries'][cache.entry_key(namespace, 'tile.paa')]
+
+    clock[0] += cache.TOUCH_INTERVAL - 1
+    assert cache.is_current(namespace, 'tile.paa', 'hash-tile')
+    assert cache.list_tiles(namespace, 'ti') == ['tile.tile']
+    assert entry['last_used'] == 1000.0
+    assert not cache.dirty
+
+    clock[0] += 2
+    assert cache.is_current(namespace, 'tile.paa', 'hash-tile')
+    assert entry['last_used'] == clock[0]
+    assert cache.dirty
+
+
+def test_is_current_checks_the_source_hash(tmp_path):
+    cache = make_cache(tmp_path)
+    namespace = cache.namespace_for(str(tmp_path / 'map'))
+    store_tile(cache, namespace, 'tile')
+
+    assert cache.is_current(namespace, 'tile.paa', 'hash-tile')
+    assert not cache.is_current(namespace, 'tile.paa', 'hash-changed')
+    assert not cache.is_current(namespace, 'other.paa', 'hash-tile')
+
+
+def test_remove_drops_tile_and_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    namespace = cache.namespace_for(str(tmp_path / 'map'))
+    store_tile(cache, namespace, 'kept')
+    store_tile(cache, namespace, 'deleted')
+
+    cache.remove(namespace, 'deleted.paa')
+    cache.remove(namespace, 'never_cached.paa')
+
+    assert cached_names(cache) == ['kept.tile']
+    assert cache.list_tiles(namespace, '') == ['kept.tile']
+    assert not cache.is_current(namespace, 'deleted.paa', 'hash-deleted')
+
+
+def test_index_survives_reload(tmp_path):
+    cache = make_cache(tmp_path)
+    image_directory = str(tmp_path / 'map')
+    namespace = cache.namespace_for(image_directory)
+    store_tile(cache, namespace, 'tile')
+    cache.save_index()
+
+    reloaded = make_cache(tmp_path)
+
+    assert reloaded.find_namespace(image_directory) == namespace
+    assert reloaded.is_current(namespace, 'tile.paa', 'hash-tile')
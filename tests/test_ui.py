@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+pytest.importorskip('PIL')
+
+from ui import ImageStitcher
+
+STAND_IN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stand_in_converter.py')
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_watch_toggle_is_disabled_while_converting(app):
+    window = ImageStitcher()
+
+    window.set_conversion_controls_enabled(False)
+    assert not window.watch_checkbox.isEnabled()
+    assert not window.browse_image_dir_button.isEnabled()
+
+    window.set_conversion_controls_enabled(True)
+    assert window.watch_checkbox.isEnabled()
+
+
+def test_stopping_watch_mode_keeps_conversion_guard(app):
+    window = ImageStitcher()
+    window.conversion_busy = True
+
+    window.stop_watching()
+
+    assert window.conversion_busy
+
+
+def test_tiles_that_fail_to_convert_keep_their_previous_preview(app, tmp_path):
+    from PIL import Image
+    from tile_cache import TileCache
+
+    image_directory = tmp_path / 'map'
+    image_directory.mkdir()
+    (image_directory / 'S_000_000_lco.paa').write_text("fail_times=10\n", encoding='utf-8')
+    (image_directory / 'S_001_000_lco.paa').write_text("", encoding='utf-8')
+
+    window = ImageStitcher()
+    window.tile_cache = TileCache(str(tmp_path / 'cache'), 64)
+    namespace = window.tile_cache.namespace_for(str(image_directory))
+    window.tile_cache.store(namespace, 'S_000_000_lco.paa', Image.new('RGB', (16, 16), (255, 0, 0)), 'old-hash')
+    # The stand-in does not write a real PNG, store a tile for the successful conversion instead
+    window.store_converted_tile = lambda job: window.tile_cache.store(
+        namespace, job.key, Image.new('RGB', (16, 16), (0, 255, 0)), job.payload[1])
+    window.imagetopaa_path = STAND_IN
+    window.image_directory_entry.setText(str(image_directory))
+    window.grid_size_entry.setText("2")
+    window.trim_pixels_entry.setText("0")
+    window.preview_quality_entry.setText("8")
+    window.color_var.setText("#000000")
+    store = window.get_preview_store(2, 8)
+    store.fill("#000000")
+    window.render_preview(store)
+
+    window.update_changed_tiles(['S_000_000_lco.paa', 'S_001_000_lco.paa'])
+
+    def pixel(x, y):
+        offset = y * store.bytes_per_line + x * store.BYTES_PER_PIXEL
+        return bytes(store.buffer[offset:offset + 3])
+
+    assert pixel(2, 2) == b'\x00\x00\x00'
+    assert pixel(10, 2) == b'\x00\xff\x00'
+    assert window.status_label.text() == "Updated 1 tiles, 1 failed to convert."
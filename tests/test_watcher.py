@@ -0,0 +1,71 @@
+import os
+import time
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from watcher import TileWatcher
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def watcher(app, tmp_path):
+    watcher = TileWatcher(str(tmp_path), debounce_ms=500, poll_ms=60000)
+    reports = []
+    watcher.tilesChanged.connect(lambda changed, removed: reports.append((changed, removed)))
+    yield watcher, reports
+    watcher.stop()
+
+
+def write_settled(path, content):
+    path.write_bytes(content)
+    settled = time.time() - 10
+    os.utime(path, (settled, settled))
+
+
+def test_settled_new_and_changed_tiles_are_reported(watcher, tmp_path):
+    tile_watcher, reports = watcher
+    write_settled(tmp_path / 'S_000_000_lco.paa', b'first')
+    write_settled(tmp_path / 'notes.txt', b'ignored')
+
+    tile_watcher.check_changes()
+    write_settled(tmp_path / 'S_000_000_lco.paa', b'second version')
+    tile_watcher.check_changes()
+    tile_watcher.check_changes()
+
+    assert reports == [(['S_000_000_lco.paa'], []), (['S_000_000_lco.paa'], [])]
+
+
+def test_tile_still_being_written_is_reported_once_it_settles(watcher, tmp_path):
+    tile_watcher, reports = watcher
+    path = tmp_path / 'S_001_000_lco.paa'
+    path.write_bytes(b'partial')
+
+    tile_watcher.check_changes()
+
+    assert reports == []
+    assert 'S_001_000_lco.paa' not in tile_watcher.snapshot
+    assert tile_watcher.debounce_timer.isActive()
+
+    settled = time.time() - 10
+    os.utime(path, (settled, settled))
+    tile_watcher.check_changes()
+
+    assert reports == [(['S_001_000_lco.paa'], [])]
+
+
+def test_removed_tile_is_reported(watcher, tmp_path):
+    tile_watcher, reports = watcher
+    path = tmp_path / 'S_002_000_lco.png'
+    write_settled(path, b'tile')
+    tile_watcher.check_changes()
+
+    path.unlink()
+    tile_watcher.check_changes()
+
+    assert reports == [(['S_002_000_lco.png'], []), ([], ['S_002_000_lco.png'])]
@@ -0,0 +1,236 @@
+import os
+import mmap
+import json
+import time
+import shutil
+import struct
+import hashlib
+import threading
+from PIL import Image
+
+TILE_MAGIC = b'DZTILE1\x00'
+TILE_HEADER = struct.Struct('<8sII4s')
+TILE_EXTENSION = '.tile'
+
+
+def write_tile(path, image):
+    """Writes raw pixels with a small header, so the tile can be read back without a zlib inflate"""
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    temp_path = path + '.part'
+    with open(temp_path, 'wb') as f:
+        f.write(TILE_HEADER.pack(TILE_MAGIC, image.width, image.height, image.mode.encode('ascii').ljust(4, b'\x00')))
+        f.write(image.tobytes())
+    os.replace(temp_path, path)
+    return TILE_HEADER.size + image.width * image.height * len(image.mode)
+
+
+def read_tile(path):
+    """Memory-maps a tile file and wraps the pixels in a PIL image"""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, width, height, mode = TILE_HEADER.unpack_from(mapped)
+    if magic != TILE_MAGIC:
+        mapped.close()
+        raise ValueError(f"Not a cached tile: {path}")
+    mode = mode.rstrip(b'\x00').decode('ascii')
+    pixels = memoryview(mapped)[TILE_HEADER.size:]
+    # RGBA tiles share the mapped memory, RGB tiles are copied once without decompression
+    return Image.frombuffer(mode, (width, height), pixels, 'raw', mode, 0, 1)
+
+
+def open_tile(path):
+    """Opens either a cached tile or a regular image file"""
+    if path.endswith(TILE_EXTENSION):
+        return read_tile(path)
+    return Image.open(path)
+
+
+class TileCache:
+    """Size-bounded store of converted tiles, with one namespace per image directory and LRU eviction"""
+    INDEX_FILE = 'cache_index.json'
+    # Access times are only refreshed this often, so repeated previews do not rewrite the index
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, root, limit_mb):
+        self.root = root
+        self.index_path = os.path.join(root, self.INDEX_FILE)
+        self.limit_bytes = limit_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+        self.dirty = False
+        self.pinned = set()
+
+    def set_limit(self, limit_mb):
+        self.limit_bytes = limit_mb * 1024 * 1024
+
+    def load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if 'namespaces' in index and 'entries' in index:
+                    return index
+            except Exception:
+                pass
+        return {'namespaces': {}, 'entries': {}}
+
+    def save_index(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            try:
+                with open(self.index_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.index, f, indent=2)
+                self.dirty = False
+            except Exception as e:
+                print(f"Error while saving cache index: {e}")
+
+    def namespace_id(self, image_directory):
+        directory = os.path.normcase(os.path.abspath(image_directory))
+        return hashlib.md5(directory.encode('utf-8')).hexdigest()[:16]
+
+    def find_namespace(self, image_directory):
+        """Returns the namespace of a directory that already has cached tiles, without creating one"""
+        namespace = self.namespace_id(image_directory)
+        return namespace if namespace in self.index['namespaces'] else None
+
+    def namespace_for(self, image_directory):
+        namespace = self.namespace_id(image_directory)
+        with self.lock:
+            if namespace not in self.index['namespaces']:
+                self.index['namespaces'][namespace] = os.path.normcase(os.path.abspath(image_directory))
+                self.dirty = True
+        os.makedirs(self.namespace_dir(namespace), exist_ok=True)
+        return namespace
+
+    def namespace_dir(self, namespace):
+        return os.path.join(self.root, namespace)
+
+    def tile_filename(self, source_file):
+        return os.path.splitext(source_file)[0] + TILE_EXTENSION
+
+    def staging_path(self, namespace, source_file):
+        """Path where the external converter writes its PNG before it is moved into the cache"""
+        return os.path.join(self.namespace_dir(namespace), os.path.splitext(source_file)[0] + '.png')
+
+    def entry_key(self, namespace, source_file):
+        return f"{namespace}/{self.tile_filename(source_file)}"
+
+    def touch(self, entry, now):
+        if now - entry.get('last_used', 0) > self.TOUCH_INTERVAL:
+            entry['last_used'] = now
+            self.dirty = True
+
+    def is_current(self, namespace, source_file, source_hash):
+        """Checks that the cached tile matches the source, and marks it as recently used if it does"""
+        tile_path = os.path.join(self.namespace_dir(namespace), self.tile_filename(source_file))
+        with self.lock:
+            entry = self.index['entries'].get(self.entry_key(namespace, source_file))
+            if not entry or entry.get('hash') != source_hash or not os.path.exists(tile_path):
+                return False
+            self.touch(entry, time.time())
+        return True
+
+    def pin(self, namespace, source_files):
+        """Protects the tiles of a running job from eviction until they are unpinned"""
+        keys = {self.entry_key(namespace, source_file) for source_file in source_files}
+        with self.lock:
+            self.pinned.update(keys)
+        return keys
+
+    def unpin(self, keys):
+        with self.lock:
+            self.pinned.difference_update(keys)
+
+    def is_over_limit(self):
+        return self.total_size() > self.limit_bytes
+
+    def store(self, namespace, source_file, image, source_hash):
+        tile_filename = self.tile_filename(source_file)
+        size = write_tile(os.path.join(self.namespace_dir(namespace), tile_filename), image)
+        key = f"{namespace}/{tile_filename}"
+        with self.lock:
+            self.index['entries'][key] = {'hash': source_hash, 'size': size, 'last_used': time.time()}
+            self.dirty = True
+        self.evict(protected=(key,))
+        return tile_filename
+
+    def remove(self, namespace, source_file):
+        """Drops the cached tile of a source file that was deleted"""
+        tile_path = os.path.join(self.namespace_dir(namespace), self.tile_filename(source_file))
+        with self.lock:
+            try:
+                os.remove(tile_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove {tile_path}: {e}")
+            if self.index['entries'].pop(self.entry_key(namespace, source_file), None) is not None:
+                self.dirty = True
+
+    def store_png(self, namespace, source_file, png_path, source_hash):
+        with Image.open(png_path) as img:
+            img.load()
+            tile_filename = self.store(namespace, source_file, img, source_hash)
+        os.remove(png_path)
+        return tile_filename
+
+    def list_tiles(self, namespace, prefix):
+        """Returns the cached tiles of a namespace and marks them as recently used"""
+        directory = self.namespace_dir(namespace)
+        if not os.path.exists(directory):
+            return []
+        now = time.time()
+        tiles = []
+        with self.lock:
+            for filename in os.listdir(directory):
+                entry = self.index['entries'].get(f"{namespace}/{filename}")
+                if entry and filename.startswith(prefix) and filename.endswith(TILE_EXTENSION):
+                    self.touch(entry, now)
+                    tiles.append(filename)
+        return tiles
+
+    def total_size(self):
+        return sum(entry.get('size', 0) for entry in self.index['entries'].values())
+
+    def evict(self, protected=()):
+        """Removes least recently used tiles until the cache is within its size limit, never touching pinned tiles"""
+        with self.lock:
+            total = self.total_size()
+            if total <= self.limit_bytes:
+                return
+            protected = self.pinned.union(protected)
+            by_age = sorted(self.index['entries'].items(), key=lambda item: item[1].get('last_used', 0))
+            for key, entry in by_age:
+                if total <= self.limit_bytes:
+                    break
+                if key in protected:
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, *key.split('/')))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # The tile is still memory-mapped somewhere, try again on the next eviction
+                    print(f"Could not evict {key}: {e}")
+                    continue
+                del self.index['entries'][key]
+                self.dirty = True
+                total -= entry.get('size', 0)
+
+    def clear(self, namespace=None):
+        with self.lock:
+            if namespace is None:
+                if os.path.exists(self.root):
+                    shutil.rmtree(self.root)
+                self.index = {'namespaces': {}, 'entries': {}}
+            else:
+                shutil.rmtree(self.namespace_dir(namespace), ignore_errors=True)
+                self.index['namespaces'].pop(namespace, None)
+                for key in [k for k in self.index['entries'] if k.startswith(namespace + '/')]:
+                    del self.index['entries'][key]
+            self.dirty = True
+        os.makedirs(self.root, exist_ok=True)
+        self.save_index()
@@ -1,21 +1,30 @@
 import os
-import subprocess
-import shutil
 import hashlib
-import json
-from concurrent.futures import ThreadPoolExecutor
 from PyQt5 import QtWidgets, QtGui, QtCore
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QColorDialog, QGraphicsView, QGraphicsScene
 from stitcher import ImageStitcherLogic
 from helpers import select_color, validate_inputs
+from planner import default_memory_budget_mb
+from tile_cache import TileCache
+from converter import ConversionJob, ConversionScheduler, build_command
+from preview_store import PreviewStore, PreviewItem
+from watcher import TileWatcher
+
+DEFAULT_CACHE_LIMIT_MB = 4096
 
 class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
     def __init__(self):
         super().__init__()
         self.imagetopaa_path = ""
         self.temp_dir = os.path.join(os.getcwd(), "temp")
-        self.cache_file = os.path.join(self.temp_dir, "cache_info.json")
+        self.tile_cache = TileCache(self.temp_dir, DEFAULT_CACHE_LIMIT_MB)
         self.current_paa_cache = {}
+        self.preview_store = None
+        self.preview_item = None
+        self.tile_watcher = None
+        self.conversion_busy = False
+        self.watch_busy = False
+        self.watch_pending = set()
         self.initUI()
 
     def initUI(self):
@@ -80,6 +89,18 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
         self.workers_entry.setToolTip("Enter the number of workers for parallel processing (1-64)")
         workers_layout.addWidget(self.workers_entry, 0, 1)
 
+        workers_layout.addWidget(QtWidgets.QLabel("Memory Budget (MB):"), 1, 0)
+        self.memory_budget_entry = QtWidgets.QLineEdit(str(default_memory_budget_mb()))
+        self.memory_budget_entry.setValidator(QtGui.QIntValidator(256, 1048576))
+        self.memory_budget_entry.setToolTip("Maximum memory the merge and preview may use. Larger maps are stitched in bands to stay within it.")
+        workers_layout.addWidget(self.memory_budget_entry, 1, 1)
+
+        workers_layout.addWidget(QtWidgets.QLabel("Cache Limit (MB):"), 2, 0)
+        self.cache_limit_entry = QtWidgets.QLineEdit(str(DEFAULT_CACHE_LIMIT_MB))
+        self.cache_limit_entry.setValidator(QtGui.QIntValidator(64, 1048576))
+        self.cache_limit_entry.setToolTip("Maximum disk space for converted tiles. The least recently used tiles are removed first.")
+        workers_layout.addWidget(self.cache_limit_entry, 2, 1)
+
         workers_group.setLayout(workers_layout)
         left_panel.addWidget(workers_group)
 
@@ -140,6 +161,16 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
         self.reload_preview_button.setToolTip("Click to reload the preview")
         preview_layout.addWidget(self.reload_preview_button)
 
+        watch_layout = QtWidgets.QHBoxLayout()
+        self.watch_checkbox = QtWidgets.QCheckBox("Watch Directory")
+        self.watch_checkbox.toggled.connect(self.toggle_watch)
+        self.watch_checkbox.setToolTip("Convert and update changed tiles in the preview as soon as they are saved")
+        watch_layout.addWidget(self.watch_checkbox)
+        self.update_output_checkbox = QtWidgets.QCheckBox("Update Output")
+        self.update_output_checkbox.setToolTip("Also paste changed tiles into the existing output image")
+        watch_layout.addWidget(self.update_output_checkbox)
+        preview_layout.addLayout(watch_layout)
+
         preview_group.setLayout(preview_layout)
         left_panel.addWidget(preview_group)
 
@@ -236,14 +267,18 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
             "2. Set Grid Size and Trim Pixels: Enter the grid size and the number of pixels to trim from each image.\n"
             "3. Select Prefix: Choose the prefix for the images to be stitched.\n"
             "4. Choose Background Color: Select a background color for the stitched image.\n"
-            "5. Set Workers: Choose the number of workers (1-64) for parallel processing. More workers = faster conversion but more CPU usage.\n"
+            "5. Set Workers: Choose the number of workers (1-64) for parallel processing. More workers = faster conversion but more CPU usage. "
+            "The Memory Budget limits how much RAM a merge or preview may use; the number of workers and banded stitching are chosen to fit it.\n"
             "6. (Optional) Set ImageToPAA Path: If you have .paa files, select the path to ImageToPAA.exe from DayZTools.\n"
             "7. Select Image Directory: Browse and select the directory containing the images to be stitched.\n"
             "8. Specify Output Path: Browse and specify the output path for the final stitched image.\n"
             "9. Set Preview Quality: Enter the desired quality for the preview image.\n"
             "10. Generate Preview: Click 'Reload preview' to generate and view a preview of the stitched image.\n"
-            "11. Stitch Images: Click 'Merge' to start the stitching process and save the final image to the specified output path.\n\n"
-            "Note: PAA files will be automatically converted to PNG using ImageToPAA and stored in a temporary folder during processing."
+            "11. Stitch Images: Click 'Merge' to start the stitching process and save the final image to the specified output path.\n"
+            "12. (Optional) Watch Directory: Tiles saved to the image directory are converted and updated in the preview automatically. "
+            "With 'Update Output' checked they are also pasted into the existing output image.\n\n"
+            "Note: PAA files will be automatically converted using ImageToPAA and cached as raw tiles in the temp folder, one subfolder per image directory. "
+            "The cache is limited by 'Cache Limit'; the least recently used tiles are removed first."
         )
         QMessageBox.information(self, "Help", help_message)
 
@@ -256,22 +291,44 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
             return True
         return super().eventFilter(source, event)
 
-    def render_preview(self, image):
+    def get_preview_store(self, grid_size, preview_quality):
+        if self.preview_store is not None and self.preview_store.matches(grid_size, preview_quality):
+            return self.preview_store
         self.graphics_scene.clear()
-        qimage = QtGui.QImage(image.tobytes(), image.width, image.height, image.width * 3, QtGui.QImage.Format_RGB888)
-        pixmap = QtGui.QPixmap.fromImage(qimage)
-        self.graphics_scene.addPixmap(pixmap)
-        self.graphics_view.fitInView(self.graphics_scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
-
-    def update_preview_info(self, preview_image, full_image_size):
-        preview_size = preview_image.size
+        self.preview_item = None
+        if self.preview_store is not None:
+            self.preview_store.release()
+        self.preview_store = PreviewStore(grid_size, preview_quality)
+        return self.preview_store
+
+    def render_preview(self, store):
+        if self.preview_item is not None and self.preview_item.store is store:
+            self.preview_item.update()
+            return
+        self.graphics_scene.clear()
+        self.preview_item = PreviewItem(store)
+        self.graphics_scene.addItem(self.preview_item)
+        self.graphics_scene.setSceneRect(self.preview_item.boundingRect())
+        self.graphics_view.fitInView(self.preview_item, QtCore.Qt.KeepAspectRatio)
+
+    def update_preview_tiles(self, tiles, background_color):
+        """Patches changed tiles into the shown preview, tiles maps (x, y) to a scaled image or None for a removed tile"""
+        if self.preview_item is None:
+            return
+        store = self.preview_store
+        for (x, y), scaled_img in tiles.items():
+            if x < store.grid_size and y < store.grid_size:
+                rect = store.paste_tile(x, y, scaled_img, background_color)
+                self.preview_item.update(QtCore.QRectF(rect))
+
+    def update_preview_info(self, preview_store, full_image_size):
+        preview_size = preview_store.size
         self.preview_info_label.setText(
             f"Preview Image Size: {preview_size[0]}x{preview_size[1]}\n"
             f"Full Image Size: {full_image_size[0]}x{full_image_size[1]}"
         )
 
     def select_image_directory(self):
-        self.clear_cache() 
         try:
             if not validate_inputs(self.grid_size_entry, self.trim_pixels_entry):
                 raise ValueError("Fill in 'Grid Size' and 'Trim Pixels. Grid size cannot be greater than 128 and Trim pixels cannot be greater than 32")
@@ -282,12 +339,34 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
                 
                 if path != previous_dir:
                     self.process_paa_files_if_needed(path)
+                    if self.watch_checkbox.isChecked():
+                        self.toggle_watch(True)
                 
                 self.reload_preview()
         except ValueError as ve:
             QMessageBox.critical(self, "Input Error", str(ve))
             print(f"Input Error: {ve}")
     
+    def toggle_watch(self, enabled):
+        self.stop_watching()
+        if not enabled:
+            return
+        image_directory = self.image_directory_entry.text()
+        if not image_directory or not os.path.isdir(image_directory):
+            QMessageBox.critical(self, "Input Error", "Select an image directory before enabling watch mode.")
+            print("Input Error: Select an image directory before enabling watch mode.")
+            self.watch_checkbox.setChecked(False)
+            return
+        self.tile_watcher = TileWatcher(image_directory, parent=self)
+        self.tile_watcher.tilesChanged.connect(self.apply_tile_changes)
+        self.update_status(f"Watching {image_directory} for changes...")
+
+    def stop_watching(self):
+        if self.tile_watcher is not None:
+            self.tile_watcher.stop()
+            self.tile_watcher.deleteLater()
+            self.tile_watcher = None
+
     def process_paa_files_if_needed(self, image_directory):
         try:
             prefix = self.prefix_var.currentText()
@@ -319,7 +398,7 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
         select_color(self.color_var)
     
     def select_imagetopaa_path(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Select ImageToPAA.exe", "", "Executable files (*.exe);;All files (*.*)")
+        path, _ = QFileDialog.getOpenFileName(self, "Select ImageToPAA.exe", "", "Executable files (*.exe);;Python scripts (*.py);;All files (*.*)")
         if path:
             self.imagetopaa_path_entry.setText(path)
             self.imagetopaa_path = path
@@ -334,58 +413,29 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
         except Exception:
             return None
     
-    def load_cache_info(self):
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
-    
-    def save_cache_info(self, cache_data):
-        os.makedirs(self.temp_dir, exist_ok=True)
+    def get_cache_limit_mb(self):
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, indent=2)
-        except Exception as e:
-            print(f"Error while saving cache: {e}")
-    
-    def check_paa_files_changed(self, paa_files, image_directory):
-        cache_data = self.load_cache_info()
+            return int(self.cache_limit_entry.text())
+        except (ValueError, AttributeError):
+            return DEFAULT_CACHE_LIMIT_MB
+
+    def check_paa_files_changed(self, paa_files, image_directory, namespace):
         changed_files = []
         
         for paa_file in paa_files:
             paa_path = os.path.join(image_directory, paa_file)
             current_hash = self.get_file_hash(paa_path)
-            png_filename = paa_file.replace('.paa', '.png')
-            png_path = os.path.join(self.temp_dir, png_filename)
             
-            if (paa_file in cache_data and 
-                cache_data[paa_file].get('hash') == current_hash and 
-                os.path.exists(png_path)):
-                self.current_paa_cache[paa_file] = png_filename
+            if self.tile_cache.is_current(namespace, paa_file, current_hash):
+                self.current_paa_cache[paa_file] = self.tile_cache.tile_filename(paa_file)
             else:
-                changed_files.append(paa_file)
+                changed_files.append((paa_file, current_hash))
         
         return changed_files
     
-    def convert_single_paa(self, args):
-        paa_file, paa_path, png_path, imagetopaa_path = args
-        
-        try:
-            cmd = [imagetopaa_path, paa_path, png_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0 and os.path.exists(png_path):
-                return paa_file, True, None
-            else:
-                return paa_file, False, f"Conversion error: {result.stderr}"
-                
-        except subprocess.TimeoutExpired:
-            return paa_file, False, "Timeout during conversion"
-        except Exception as e:
-            return paa_file, False, str(e)
+    def store_converted_tile(self, job):
+        namespace, file_hash = job.payload
+        self.tile_cache.store_png(namespace, job.key, job.output_path, file_hash)
     
     def convert_paa_to_png(self, paa_files, image_directory):
         if not self.imagetopaa_path:
@@ -394,108 +444,126 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
         if not os.path.exists(self.imagetopaa_path):
             raise ValueError(f"ImageToPAA not found at: {self.imagetopaa_path}")
         
-        os.makedirs(self.temp_dir, exist_ok=True)
+        if self.conversion_busy:
+            raise ValueError("A conversion is already running. Wait for it to finish.")
+        
+        self.tile_cache.set_limit(self.get_cache_limit_mb())
+        namespace = self.tile_cache.namespace_for(image_directory)
         
         self.preview_progress_bar.setValue(0)
         self.preview_progress_bar.setMaximum(len(paa_files))
         
-        files_to_convert = self.check_paa_files_changed(paa_files, image_directory)
+        # The scheduler keeps the UI responsive, so stop the user from starting a second conversion meanwhile
+        self.conversion_busy = True
+        self.set_conversion_controls_enabled(False)
+        pinned_tiles = self.tile_cache.pin(namespace, paa_files)
+        try:
+            return self.convert_pinned_paa_files(paa_files, image_directory, namespace)
+        finally:
+            self.tile_cache.unpin(pinned_tiles)
+            self.conversion_busy = False
+            self.set_conversion_controls_enabled(True)
+    
+    def set_conversion_controls_enabled(self, enabled):
+        for widget in (self.browse_image_dir_button, self.browse_imagetopaa_button, self.reload_preview_button,
+                       self.merge_button, self.clear_cache_button, self.prefix_var, self.watch_checkbox):
+            widget.setEnabled(enabled)
+    
+    def convert_pinned_paa_files(self, paa_files, image_directory, namespace):
+        files_to_convert = self.check_paa_files_changed(paa_files, image_directory, namespace)
         
         self.update_status(f"Cache checked. Files to convert: {len(files_to_convert)} of {len(paa_files)}")
         QtWidgets.QApplication.processEvents()
         
         if files_to_convert:
-            conversion_args = []
-            for paa_file in files_to_convert:
+            jobs = []
+            for paa_file, file_hash in files_to_convert:
                 paa_path = os.path.join(image_directory, paa_file)
-                png_filename = paa_file.replace('.paa', '.png')
-                png_path = os.path.join(self.temp_dir, png_filename)
-                conversion_args.append((paa_file, paa_path, png_path, self.imagetopaa_path))
+                png_path = self.tile_cache.staging_path(namespace, paa_file)
+                jobs.append(ConversionJob(paa_file, paa_path, png_path, (namespace, file_hash)))
             
             converted_files = []
-            cache_data = self.load_cache_info()
+            failed_files = []
             
             try:
-                max_workers = min(int(self.workers_entry.text()), len(files_to_convert))
+                max_workers = int(self.workers_entry.text())
             except (ValueError, AttributeError):
-                max_workers = min(4, len(files_to_convert))
+                max_workers = 4
             
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = [executor.submit(self.convert_single_paa, args) for args in conversion_args]
+            def on_result(job, success):
+                finished = len(converted_files) + len(failed_files) + 1
+                self.update_status(f"Converting files... ({finished}/{len(jobs)})")
+                self.preview_progress_bar.setValue(len(paa_files) - len(files_to_convert) + finished)
                 
-                for i, future in enumerate(futures):
-                    self.update_status(f"Converting files... ({i + 1}/{len(futures)})")
-                    progress_value = len(paa_files) - len(files_to_convert) + i + 1
-                    self.preview_progress_bar.setValue(progress_value)
-                    QtWidgets.QApplication.processEvents()
-                    
-                    paa_file, success, error = future.result()
-                    
-                    if success:
-                        png_filename = paa_file.replace('.paa', '.png')
-                        converted_files.append(png_filename)
-                        self.current_paa_cache[paa_file] = png_filename
-                        
-                        paa_path = os.path.join(image_directory, paa_file)
-                        file_hash = self.get_file_hash(paa_path)
-                        cache_data[paa_file] = {
-                            'hash': file_hash,
-                            'png_file': png_filename
-                        }
-                    else:
-                        print(f"Conversion error {paa_file}: {error}")
-                        self.update_status(f"Conversion error {paa_file}")
+                if success:
+                    tile_filename = self.tile_cache.tile_filename(job.key)
+                    converted_files.append(tile_filename)
+                    self.current_paa_cache[job.key] = tile_filename
+                else:
+                    failed_files.append(job.key)
+                    print(f"Conversion error {job.key} after {job.attempts} attempts: {job.error}")
+                    self.update_status(f"Conversion error {job.key}")
             
-            self.save_cache_info(cache_data)
+            scheduler = ConversionScheduler(build_command(self.imagetopaa_path), max_workers)
+            scheduler.run(jobs, on_result=on_result, on_tick=QtWidgets.QApplication.processEvents,
+                          postprocess=self.store_converted_tile)
             
-            self.update_status(f"Converted {len(converted_files)} new files")
+            if failed_files:
+                self.update_status(f"Converted {len(converted_files)} new files, {len(failed_files)} failed")
+            else:
+                self.update_status(f"Converted {len(converted_files)} new files")
         else:
             self.update_status("All .paa files are already converted (using cache)")
             self.preview_progress_bar.setValue(len(paa_files))
         
-        all_png_files = []
+        self.tile_cache.save_index()
+        if self.tile_cache.is_over_limit():
+            cache_mb = self.tile_cache.total_size() // (1024 * 1024)
+            message = (f"The converted tiles need {cache_mb} MB, more than the cache limit of {self.get_cache_limit_mb()} MB.\n"
+                       "All tiles of this map were kept; raise 'Cache Limit' to avoid converting them again later.")
+            print(f"Warning: {message}")
+            QMessageBox.warning(self, "Cache Limit", message)
+        
+        all_tile_files = []
         for paa_file in paa_files:
-            png_filename = paa_file.replace('.paa', '.png')
-            png_path = os.path.join(self.temp_dir, png_filename)
-            if os.path.exists(png_path):
-                all_png_files.append(png_filename)
-                self.current_paa_cache[paa_file] = png_filename
+            tile_filename = self.tile_cache.tile_filename(paa_file)
+            if os.path.exists(os.path.join(self.tile_cache.namespace_dir(namespace), tile_filename)):
+                all_tile_files.append(tile_filename)
+                self.current_paa_cache[paa_file] = tile_filename
         
         self.preview_progress_bar.setValue(0)
         self.preview_progress_bar.setMaximum(100)
         
-        return all_png_files
+        return all_tile_files
     
-    def cleanup_temp_files(self, keep_cache=False):
-        if os.path.exists(self.temp_dir):
-            try:
-                if keep_cache:
-                    for file in os.listdir(self.temp_dir):
-                        if file.endswith('.png'):
-                            file_path = os.path.join(self.temp_dir, file)
-                            os.remove(file_path)
-                    self.current_paa_cache.clear()
-                else:
-                    shutil.rmtree(self.temp_dir)
-                    os.makedirs(self.temp_dir, exist_ok=True)
-                    self.current_paa_cache.clear()
-            except Exception as e:
-                print(f"Error while cleaning temp folder: {e}")
+    def cleanup_temp_files(self):
+        try:
+            self.tile_cache.clear()
+            self.current_paa_cache.clear()
+        except Exception as e:
+            print(f"Error while cleaning temp folder: {e}")
     
     def get_available_png_files(self, image_directory, prefix):
-        direct_png = [f for f in os.listdir(image_directory) if f.startswith(prefix) and f.endswith(".png")]
+        directory_files = os.listdir(image_directory)
+        direct_png = [f for f in directory_files if f.startswith(prefix) and f.endswith(".png")]
+        paa_names = {os.path.splitext(f)[0] for f in directory_files if f.startswith(prefix) and f.endswith(".paa")}
         
-        cached_png = []
-        if os.path.exists(self.temp_dir):
-            cached_png = [f for f in os.listdir(self.temp_dir) if f.startswith(prefix) and f.endswith(".png")]
+        namespace = self.tile_cache.find_namespace(image_directory)
+        cached_tiles = []
+        if namespace is not None:
+            cached_tiles = self.tile_cache.list_tiles(namespace, prefix)
+            self.tile_cache.save_index()
         
         result = []
         for png_file in direct_png:
             result.append((png_file, image_directory))
         
-        for png_file in cached_png:
-            if png_file not in direct_png:
-                result.append((png_file, self.temp_dir))
+        direct_names = {os.path.splitext(f)[0] for f in direct_png}
+        for tile_file in cached_tiles:
+            tile_name = os.path.splitext(tile_file)[0]
+            # Tiles whose .paa was deleted stay in the cache until evicted, but are no longer part of the map
+            if tile_name in paa_names and tile_name not in direct_names:
+                result.append((tile_file, self.tile_cache.namespace_dir(namespace)))
         
         return result
     
@@ -508,7 +576,7 @@ class ImageStitcher(QtWidgets.QWidget, ImageStitcherLogic):
                 QMessageBox.No)
             
             if reply == QMessageBox.Yes:
-                self.cleanup_temp_files(keep_cache=False)
+                self.cleanup_temp_files()
                 self.update_status("Cache has been cleared.")
                 QMessageBox.information(self, "Cache Cleared", "Cache of converted PAA files has been cleared.")
         except Exception as e:
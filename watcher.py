@@ -0,0 +1,68 @@
+import os
+import time
+from PyQt5 import QtCore
+
+WATCHED_EXTENSIONS = ('.paa', '.png')
+
+
+class TileWatcher(QtCore.QObject):
+    """Watches an image directory and reports which tile files were added, changed or removed"""
+    tilesChanged = QtCore.pyqtSignal(list, list)
+
+    def __init__(self, directory, debounce_ms=500, poll_ms=5000, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.debounce_ms = debounce_ms
+        self.snapshot = self.scan()
+
+        self.watcher = QtCore.QFileSystemWatcher([directory], self)
+        self.watcher.directoryChanged.connect(self.schedule_scan)
+
+        self.debounce_timer = QtCore.QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self.check_changes)
+
+        # Not every platform reports in-place writes to files in a watched directory, so also poll now and then
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.timeout.connect(self.check_changes)
+        self.poll_timer.start(poll_ms)
+
+    def scan(self):
+        """Returns {filename: (mtime, size)} for the tile files in the directory, without reading them"""
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(WATCHED_EXTENSIONS):
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            print(f"Error while scanning {self.directory}: {e}")
+        return snapshot
+
+    def schedule_scan(self, _path=None):
+        self.debounce_timer.start(self.debounce_ms)
+
+    def check_changes(self):
+        current = self.scan()
+        settle_before = (time.time() - self.debounce_ms / 1000) * 1e9
+        changed = []
+        for filename, state in current.items():
+            if self.snapshot.get(filename) == state:
+                continue
+            if state[0] > settle_before:
+                # Still being written, keep the old state so the file is picked up on the next scan
+                current[filename] = self.snapshot.get(filename)
+                self.schedule_scan()
+                continue
+            changed.append(filename)
+        removed = [filename for filename in self.snapshot if filename not in current]
+
+        self.snapshot = {filename: state for filename, state in current.items() if state is not None}
+        if changed or removed:
+            self.tilesChanged.emit(sorted(changed), sorted(removed))
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.debounce_timer.stop()
+        self.watcher.removePaths(self.watcher.directories())